@@ -43,12 +43,40 @@ def build_query(selection_config):
     return query
 
 
-def predict_energy(df, model, log_target=False):
+def get_valid_features(df):
+    '''
+    Convert df to a float32 feature matrix and return the rows that
+    can be predicted together with the mask of these rows.
+    Avoids copying the matrix if all rows are valid.
+    '''
     df_features = convert_to_float32(df)
-    valid = check_valid_rows(df_features)
+    valid = check_valid_rows(df_features).to_numpy()
+    X = df_features.to_numpy()
+
+    if valid.all():
+        return X, valid
+    return X[valid], valid
 
-    energy_prediction = np.full(len(df_features), np.nan)
-    energy_prediction[valid] = model.predict(df_features.loc[valid].values)
+
+def set_n_jobs(model, n_jobs):
+    '''
+    Set the number of cores used for prediction, also for the estimators
+    wrapped by a fitted CalibratedClassifierCV
+    '''
+    model.n_jobs = n_jobs
+    for calibrated in getattr(model, 'calibrated_classifiers_', []):
+        # the attribute was renamed from base_estimator in scikit-learn 1.2
+        estimator = getattr(calibrated, 'estimator', None)
+        if estimator is None:
+            estimator = calibrated.base_estimator
+        estimator.n_jobs = n_jobs
+
+
+def predict_energy(df, model, log_target=False):
+    X, valid = get_valid_features(df)
+
+    energy_prediction = np.full(len(valid), np.nan)
+    energy_prediction[valid] = model.predict(X)
 
     if log_target:
         energy_prediction[valid] = np.exp(energy_prediction[valid])
@@ -57,31 +85,133 @@ def predict_energy(df, model, log_target=False):
 
 
 def predict_disp(df, abs_model, sign_model, log_target=False):
-    df_features = convert_to_float32(df)
-    valid = check_valid_rows(df_features)
+    X, valid = get_valid_features(df)
 
-    disp_abs = abs_model.predict(df_features.loc[valid].values)
-    disp_sign = sign_model.predict(df_features.loc[valid].values)
+    disp_abs = abs_model.predict(X)
+    disp_sign = sign_model.predict(X)
 
     if log_target:
         disp_abs = np.exp(disp_abs)
 
-    disp_prediction = np.full(len(df_features), np.nan)
+    disp_prediction = np.full(len(valid), np.nan)
     disp_prediction[valid] = disp_abs * disp_sign
 
     return disp_prediction
 
 
 def predict_separator(df, model):
-    df_features = convert_to_float32(df)
-    valid = check_valid_rows(df_features)
+    X, valid = get_valid_features(df)
 
-    score = np.full(len(df_features), np.nan)
-    score[valid] = model.predict_proba(df_features.loc[valid].values)[:, 1]
+    score = np.full(len(valid), np.nan)
+    score[valid] = model.predict_proba(X)[:, 1]
 
     return score
 
 
+def parse_selection_config(selection_config):
+    '''
+    Convert a selection config into a list of (column, operator, value) tuples.
+    Supports both a list of single entry dicts column: [operator, value]
+    and the legacy dict column -> [operator, value]
+    '''
+    # legacy support for dict of column_name -> [op, val]
+    if isinstance(selection_config, dict):
+        selection_config = [{k: v} for k, v in selection_config.items()]
+
+    cuts = []
+    for c in selection_config:
+        if len(c) > 1:
+            raise ValueError('Expected dict with single entry column: [operator, value].')
+        name, (operator, value) = list(c.items())[0]
+        cuts.append((name, operator, value))
+
+    return cuts
+
+
+def compile_selection(selection_config):
+    '''
+    Parse selection_config once and return a function
+    `select(col_data, n_events=None)` creating the selection mask,
+    see `create_mask`. Use this when applying the same cuts to many chunks.
+    '''
+    cuts = [
+        (name, OPERATORS[operator], '{} {} {}'.format(name, operator, value), value)
+        for name, operator, value in parse_selection_config(selection_config)
+    ]
+
+    def select(col_data, n_events=None):
+        if n_events is None:
+            n_events = len(col_data[cuts[0][0]]) if cuts else 0
+        mask = np.ones(n_events, dtype=bool)
+
+        # once most events are removed, only evaluate the remaining cuts
+        # on the indices of the surviving events instead of the full chunk
+        surviving = None
+
+        debug = log.isEnabledFor(logging.DEBUG)
+        n_selected = n_events
+        for name, operator, description, value in cuts:
+            n_before = n_selected
+
+            if surviving is None:
+                mask &= operator(col_data[name], value)
+                n_selected = np.count_nonzero(mask)
+                if n_selected <= n_events // 2:
+                    surviving = np.flatnonzero(mask)
+            else:
+                surviving = surviving[operator(col_data[name][surviving], value)]
+                n_selected = len(surviving)
+
+            if debug:
+                log.debug('Cut "{}" removed {} events'.format(
+                    description, n_before - n_selected
+                ))
+
+            # no event left, the remaining cuts cannot change the result
+            if n_selected == 0:
+                break
+
+        if surviving is not None:
+            mask = np.zeros(n_events, dtype=bool)
+            mask[surviving] = True
+
+        return mask
+
+    return select
+
+
+def create_mask(col_data, selection_config, n_events=None):
+    '''
+    Create the selection mask for in memory data.
+
+    Parameters
+    ----------
+    col_data: dict
+        Mapping of column name to array, must contain all columns used in
+        selection_config
+    selection_config: list or dict
+        The cuts to apply, see `parse_selection_config`
+    n_events: int, optional
+        Number of events, only needed if selection_config is empty.
+        By default, the length of the columns is used.
+    '''
+    return compile_selection(selection_config)(col_data, n_events=n_events)
+
+
+def get_selection_columns(selection_config):
+    ''' Return the set of column names needed to evaluate selection_config '''
+    return {name for name, _, _ in parse_selection_config(selection_config)}
+
+
+def read_selection_columns_h5py(infile, selection_config, key='events', start=None, end=None):
+    ''' Read all columns needed for selection_config from infile[key][start:end] '''
+    group = infile[key]
+    return {
+        name: group[name][start:end]
+        for name in get_selection_columns(selection_config)
+    }
+
+
 def create_mask_h5py(
     infile,
     selection_config,
@@ -93,28 +223,133 @@ def create_mask_h5py(
     start = start or 0
     end = min(n_events, end) if end else n_events
 
-    n_selected = end - start
-    mask = np.ones(n_selected, dtype=bool)
+    col_data = read_selection_columns_h5py(
+        infile, selection_config, key=key, start=start, end=end
+    )
+    return create_mask(col_data, selection_config, n_events=end - start)
 
-    # legacy support for dict of column_name -> [op, val]
-    if isinstance(selection_config, dict):
-        selection_config = [{k: v} for k, v in selection_config.items()]
 
-    for c in selection_config:
-        if len(c) > 1:
-            raise ValueError('Expected dict with single entry column: [operator, value].')
-        name, (operator, value) = list(c.items())[0]
+def pack_event_ids(run_id, event_id):
+    '''
+    Combine run id and event id into a single uint64 key,
+    so events can be matched with vectorized numpy set operations
+    instead of pandas multi indices. Both ids need to fit into 32 bit.
+    '''
+    run_id = np.asanyarray(run_id)
+    event_id = np.asanyarray(event_id)
+
+    for ids in (run_id, event_id):
+        if len(ids) > 0 and (ids.min() < 0 or ids.max() >= 2**32):
+            raise ValueError('Ids must be in the range [0, 2**32) to be packed')
+
+    return (run_id.astype(np.uint64) << np.uint64(32)) | event_id.astype(np.uint64)
+
+
+def _get_buffer(buffers, n_rows, dtype, shape):
+    '''
+    Return a reusable array with at least n_rows rows from buffers,
+    a dict of (dtype, shape) -> array, allocating a new one if needed.
+    '''
+    buffer_key = (dtype, shape)
+    buffer = buffers.get(buffer_key)
+    if buffer is None or len(buffer) < n_rows:
+        buffer = np.empty((n_rows, ) + shape, dtype=dtype)
+        buffers[buffer_key] = buffer
+    return buffer
+
+
+def _read_chunk(dataset, start, end, buffers):
+    '''
+    Read dataset[start:end] into a reusable buffer from buffers
+    to avoid allocating a new array for each column and chunk.
+    '''
+    # read_direct does not support variable length data
+    if dataset.dtype.kind == 'O':
+        return dataset[start:end]
+
+    buffer = _get_buffer(buffers, end - start, dataset.dtype, dataset.shape[1:])
+    dataset.read_direct(buffer, source_sel=np.s_[start:end], dest_sel=np.s_[0:end - start])
+    return buffer[:end - start]
+
+
+def _select_rows(data, mask, n_selected, buffers):
+    '''
+    Select the rows of data where mask is True into a reusable buffer
+    from buffers, n_selected is the number of True entries in mask.
+    '''
+    if data.dtype.kind == 'O':
+        return data[mask]
+
+    buffer = _get_buffer(buffers, n_selected, data.dtype, data.shape[1:])
+    return np.compress(mask, data, axis=0, out=buffer[:n_selected])
+
+
+def _copy_selected_rows_h5py(
+    in_group,
+    out_group,
+    n_events,
+    create_chunk_mask,
+    chunksize,
+    progress=True,
+):
+    '''
+    Copy all rows of the 1d and 2d datasets in in_group to out_group
+    for which create_chunk_mask(start, end) returns True, chunksize rows at a time.
+    '''
+    n_chunks = int(np.ceil(n_events / chunksize))
+    log.debug('Using {} chunks of size {}'.format(n_chunks, chunksize))
 
-        before = mask.sum()
-        mask = np.logical_and(
-            mask, OPERATORS[operator](infile[key][name][start:end], value)
+    # output datasets grow geometrically and are truncated at the end
+    lengths = {}
+    capacities = {}
+    # buffers for reading and selecting,
+    # shared by all columns with the same dtype and shape
+    read_buffers = {}
+    select_buffers = {}
+    # look up the input and output datasets only once
+    datasets = {}
+    out_datasets = {}
+    for name, dataset in in_group.items():
+        if dataset.ndim not in (1, 2):
+            log.warning('Skipping not 1d or 2d column {}'.format(name))
+            continue
+
+        datasets[name] = dataset
+        out_datasets[name] = out_group.create_dataset(
+            name,
+            shape=(0, ) + dataset.shape[1:],
+            dtype=dataset.dtype,
+            maxshape=(None, ) + dataset.shape[1:],
+            chunks=True,
         )
-        after = mask.sum()
-        log.debug('Cut "{} {} {}" removed {} events'.format(
-            name, operator, value, before - after
-        ))
+        lengths[name] = 0
+        capacities[name] = 0
+
+    for chunk in tqdm(range(n_chunks), disable=not progress, total=n_chunks):
+        start = chunk * chunksize
+        end = min(n_events, (chunk + 1) * chunksize)
 
-    return mask
+        mask = create_chunk_mask(start, end)
+
+        n_new = np.count_nonzero(mask)
+        if n_new == 0:
+            continue
+
+        for name, dataset in datasets.items():
+            out_dataset = out_datasets[name]
+            n_old = lengths[name]
+            if n_old + n_new > capacities[name]:
+                capacities[name] = max(2 * capacities[name], n_old + n_new)
+                out_dataset.resize(capacities[name], axis=0)
+
+            data = _read_chunk(dataset, start, end, read_buffers)
+            out_dataset[n_old:n_old + n_new] = _select_rows(
+                data, mask, n_new, select_buffers
+            )
+            lengths[name] = n_old + n_new
+
+    for name, length in lengths.items():
+        out_datasets[name].resize(length, axis=0)
 
 
 def apply_cuts_h5py_chunked(
@@ -131,42 +366,63 @@ def apply_cuts_h5py_chunked(
     '''
 
     n_events = get_number_of_rows_in_table(input_path, key=key, )
-    n_chunks = int(np.ceil(n_events / chunksize))
-    log.debug('Using {} chunks of size {}'.format(n_chunks, chunksize))
 
     with h5py.File(input_path, 'r') as infile, h5py.File(output_path, 'w') as outfile:
-        group = outfile.create_group(key)
-
-        for chunk in tqdm(range(n_chunks), disable=not progress, total=n_chunks):
-            start = chunk * chunksize
-            end = min(n_events, (chunk + 1) * chunksize)
+        in_group = infile[key]
+        selection_datasets = {
+            name: in_group[name] for name in get_selection_columns(selection_config)
+        }
+        select = compile_selection(selection_config)
+
+        def create_chunk_mask(start, end):
+            # read each column needed for the cuts only once per chunk
+            col_data = {
+                name: dataset[start:end] for name, dataset in selection_datasets.items()
+            }
+            return select(col_data, n_events=end - start)
+
+        _copy_selected_rows_h5py(
+            in_group,
+            outfile.create_group(key),
+            n_events,
+            create_chunk_mask,
+            chunksize=chunksize,
+            progress=progress,
+        )
 
-            mask = create_mask_h5py(
-                infile, selection_config, n_events, key=key, start=start, end=end
-            )
 
-            for name, dataset in infile[key].items():
-                if chunk == 0:
-                    if dataset.ndim == 1:
-                        group.create_dataset(
-                            name, data=dataset[start:end][mask], maxshape=(None, )
-                        )
-                    elif dataset.ndim == 2:
-                        group.create_dataset(
-                            name, data=dataset[start:end, :][mask, :], maxshape=(None, 2)
-                        )
-                    else:
-                        log.warning('Skipping not 1d or 2d column {}'.format(name))
-
-                else:
-
-                    n_old = group[name].shape[0]
-                    n_new = mask.sum()
-                    group[name].resize(n_old + n_new, axis=0)
-
-                    if dataset.ndim == 1:
-                        group[name][n_old:n_old + n_new] = dataset[start:end][mask]
-                    elif dataset.ndim == 2:
-                        group[name][n_old:n_old + n_new, :] = dataset[start:end][mask, :]
-                    else:
-                        log.warning('Skipping not 1d or 2d column {}'.format(name))
+def apply_event_selection_h5py_chunked(
+    input_path,
+    output_path,
+    selected_events,
+    key='array_events',
+    run_id_column='run_id',
+    event_id_column='array_event_id',
+    chunksize=100000,
+    progress=True,
+):
+    '''
+    Copy the events of table key in input_path whose ids are contained in
+    selected_events, an array of keys created by `pack_event_ids`,
+    to the same table in output_path. The output file must already exist.
+    '''
+    n_events = get_number_of_rows_in_table(input_path, key=key)
+    selected_events = np.unique(selected_events)
+
+    with h5py.File(input_path, 'r') as infile, h5py.File(output_path, 'r+') as outfile:
+        in_group = infile[key]
+        run_ids = in_group[run_id_column]
+        event_ids = in_group[event_id_column]
+
+        def create_chunk_mask(start, end):
+            keys = pack_event_ids(run_ids[start:end], event_ids[start:end])
+            return np.isin(keys, selected_events)
+
+        _copy_selected_rows_h5py(
+            in_group,
+            outfile.create_group(key),
+            n_events,
+            create_chunk_mask,
+            chunksize=chunksize,
+            progress=progress,
+        )
@@ -1,3 +1,4 @@
+import ast
 import astropy.units as u
 from ruamel.yaml import YAML
 from collections import namedtuple
@@ -66,10 +67,62 @@ def print_supported_regressors():
     print_models(is_regressor)
 
 
+# all estimators that can be used in the model configs, e.g. 'ensemble.RandomForestClassifier'
+sklearn_models = {
+    module_name + '.' + cls_name: getattr(module, cls_name)
+    for module_name, module in sklearn_modules.items()
+    for cls_name in dir(module)
+    if not cls_name.startswith('_') and isinstance(getattr(module, cls_name), type)
+}
+
+
+def _build_model(call):
+    ''' Create the model for a parsed `module.Model(...)` call node '''
+    if not isinstance(call, ast.Call):
+        raise ValueError('Model definition must be a call like "module.Model(...)"')
+
+    func = call.func
+    if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)):
+        raise ValueError('Model definition must be a call like "module.Model(...)"')
+
+    model_cls = sklearn_models.get(func.value.id + '.' + func.attr)
+    if model_cls is None:
+        raise ValueError('Unknown model "{}.{}"'.format(func.value.id, func.attr))
+
+    if any(kw.arg is None for kw in call.keywords):
+        raise ValueError('Model arguments must be given explicitly')
+
+    args = [_parse_argument(arg) for arg in call.args]
+    kwargs = {kw.arg: _parse_argument(kw.value) for kw in call.keywords}
+    return model_cls(*args, **kwargs)
+
+
+def _parse_argument(node):
+    ''' Arguments are either literals or nested models, e.g. a base estimator '''
+    if isinstance(node, ast.Call):
+        return _build_model(node)
+    return ast.literal_eval(node)
+
+
+def parse_model(config):
+    '''
+    Create the model described by a config string like
+    `ensemble.RandomForestClassifier(n_estimators=30, max_depth=8)`.
+    Only classes in `sklearn_models` and literal arguments are allowed,
+    models can be nested, e.g. as base estimator of an ensemble.
+    '''
+    try:
+        call = ast.parse(config.strip(), mode='eval').body
+    except SyntaxError:
+        raise ValueError('Invalid model definition: "{}"'.format(config))
+
+    return _build_model(call)
+
+
 def load_regressor(config):
     try:
-        return eval(config, {}, sklearn_modules)
-    except (NameError, AttributeError):
+        return parse_model(config)
+    except ValueError:
         log.error('Unsupported Regressor: "' + config + '"')
         print_supported_regressors()
         raise
@@ -77,9 +130,9 @@ def load_regressor(config):
 
 def load_classifier(config):
     try:
-        return eval(config, {}, sklearn_modules)
-    except (NameError, AttributeError):
-        log.error('Unsupported Regressor: "' + config + '"')
+        return parse_model(config)
+    except ValueError:
+        log.error('Unsupported Classifier: "' + config + '"')
         print_supported_classifiers()
         raise
 
@@ -459,23 +459,40 @@ def append_column_to_hdf5(path, array, table_name, new_column_name):
     new_column_name : str
         name of the new column
     '''
-    with h5py.File(path, 'r+') as f:
-        group = f.require_group(table_name)  # create if not exists
-
-        max_shape = list(array.shape)
-        max_shape[0] = None
-        if new_column_name not in group.keys():
-            group.create_dataset(
-                new_column_name,
-                data=array,
-                maxshape=tuple(max_shape),
-            )
-        else:
-            n_existing = group[new_column_name].shape[0]
-            n_new = array.shape[0]
+    append_columns_to_hdf5(path, {table_name: {new_column_name: array}})
+
+
+def append_columns_to_hdf5(path, tables):
+    '''
+    Add several arrays as new columns to the given file,
+    opening the file only once.
 
-            group[new_column_name].resize(n_existing + n_new, axis=0)
-            group[new_column_name][n_existing:n_existing + n_new] = array
+    Parameters
+    ----------
+    path : str
+        path to file
+    tables : dict
+        mapping of group name to a dict of column name -> values to append
+    '''
+    with h5py.File(path, 'r+') as f:
+        for table_name, columns in tables.items():
+            group = f.require_group(table_name)  # create if not exists
+
+            for new_column_name, array in columns.items():
+                max_shape = list(array.shape)
+                max_shape[0] = None
+                if new_column_name not in group.keys():
+                    group.create_dataset(
+                        new_column_name,
+                        data=array,
+                        maxshape=tuple(max_shape),
+                    )
+                else:
+                    n_existing = group[new_column_name].shape[0]
+                    n_new = array.shape[0]
+
+                    group[new_column_name].resize(n_existing + n_new, axis=0)
+                    group[new_column_name][n_existing:n_existing + n_new] = array
 
 
 def set_sample_fraction(path, fraction):
@@ -1,18 +1,17 @@
-import numpy as np
 import click
 from ruamel.yaml import YAML
-from tqdm import tqdm
-import pandas as pd
 from shutil import copyfile
 
 from ..io import (
     get_number_of_rows_in_table,
-    read_data_chunked,
     read_data,
-    write_hdf,
     copy_runs_group,
 )
-from ..apply import apply_cuts_h5py_chunked
+from ..apply import (
+    apply_cuts_h5py_chunked,
+    apply_event_selection_h5py_chunked,
+    pack_event_ids,
+)
 from ..logging import setup_logging
 
 yaml = YAML(typ='safe')
@@ -65,31 +64,19 @@ def main(configuration_path, input_path, output_path, chunksize, verbose):
     )
     if multiple_telescopes:
         log.info('Copying selected array events.')
-        # read incdex of remaining telescope events.
+        # read index of remaining telescope events.
         df_index = read_data(
             output_path,
             key='telescope_events',
-            columns=['array_event_id', 'run_id', 'telescope_id']
+            columns=['array_event_id', 'run_id']
+        )
+        selected_events = pack_event_ids(
+            df_index['run_id'].to_numpy(), df_index['array_event_id'].to_numpy()
         )
-        df_index.set_index(['run_id', 'array_event_id'], inplace=True)
-        df_index = df_index[~df_index.index.duplicated()]
-
-        df_iterator = read_data_chunked(input_path, 'array_events', chunksize=500000)
-        for array_events, _, _ in tqdm(df_iterator):
-            array_events.set_index(['run_id', 'array_event_id'], inplace=True)
-            array_events['index_in_file'] = np.arange(0, len(array_events))
 
-            array_events = pd.merge(
-                array_events,
-                df_index,
-                left_index=True,
-                right_index=True,
-                validate='one_to_one',
-            )
-            array_events.sort_values('index_in_file', inplace=True)
-            array_events.drop('index_in_file', axis='columns', inplace=True,)
-            if len(array_events > 0):
-                write_hdf(array_events, output_path, table_name='array_events', mode='a')
+        apply_event_selection_h5py_chunked(
+            input_path, output_path, selected_events, key='array_events', chunksize=500000,
+        )
 
     copy_runs_group(input_path, output_path)
 
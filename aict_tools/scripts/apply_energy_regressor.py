@@ -1,11 +1,10 @@
 import click
+import numpy as np
 from tqdm import tqdm
 
-import pandas as pd
-
 from ..apply import predict_energy
 from ..io import (
-    append_column_to_hdf5,
+    append_columns_to_hdf5,
     read_telescope_data_chunked,
     drop_prediction_column,
     load_model,
@@ -61,39 +60,33 @@ def main(configuration_path, data_path, model_path, chunksize, n_jobs, yes, verb
         feature_generation_config=model_config.feature_generation
     )
 
-    if config.has_multiple_telescopes:
-        chunked_frames = []
-
     table = config.telescope_events_key
+    array_table = config.array_events_key
     for df_data, start, stop in tqdm(df_generator):
 
         energy_prediction = predict_energy(
             df_data[model_config.features],
             model,
             log_target=model_config.log_target,
-        )
+        ).astype(np.float32)
+        new_columns = {table: {prediction_column_name: energy_prediction}}
 
         if config.has_multiple_telescopes:
+            # chunks always contain complete array events,
+            # so we can aggregate each chunk on its own
             d = df_data[['run_id', 'array_event_id']].copy()
             d[prediction_column_name] = energy_prediction
-            chunked_frames.append(d)
-        append_column_to_hdf5(data_path, energy_prediction, table, prediction_column_name)
+            d = d.groupby(
+                ['run_id', 'array_event_id'], sort=False
+            )[prediction_column_name].agg(['mean', 'std'])
 
-    if config.has_multiple_telescopes:
-        array_table = config.array_events_key
-        d = pd.concat(chunked_frames).groupby(
-            ['run_id', 'array_event_id'], sort=False
-        ).agg(['mean', 'std'])
-
-        mean = d[prediction_column_name]['mean'].values
-        std = d[prediction_column_name]['std'].values
+            new_columns[array_table] = {
+                prediction_column_name + '_mean': d['mean'].to_numpy(np.float32),
+                prediction_column_name + '_std': d['std'].to_numpy(np.float32),
+            }
 
-        append_column_to_hdf5(
-            data_path, mean, array_table, prediction_column_name + '_mean'
-        )
-        append_column_to_hdf5(
-            data_path, std, array_table, prediction_column_name + '_std'
-        )
+        # write all columns of this chunk with a single file open
+        append_columns_to_hdf5(data_path, new_columns)
 
 
 if __name__ == '__main__':
@@ -2,7 +2,7 @@ import click
 from tqdm import tqdm
 import pandas as pd
 
-from ..apply import predict_separator
+from ..apply import predict_separator, set_n_jobs
 from ..io import (
     append_column_to_hdf5,
     read_telescope_data_chunked,
@@ -17,13 +17,14 @@ from ..logging import setup_logging
 @click.argument('configuration_path', type=click.Path(exists=True, dir_okay=False))
 @click.argument('data_path', type=click.Path(exists=True, dir_okay=False))
 @click.argument('model_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('-n', '--n-jobs', type=int, help='Number of cores to use')
 @click.option('-v', '--verbose', help='Verbose log output', is_flag=True)
 @click.option(
     '-N', '--chunksize', type=int,
     help='If given, only process the given number of events at once'
 )
 @click.option('-y', '--yes', help='Do not prompt for overwrites', is_flag=True)
-def main(configuration_path, data_path, model_path, chunksize, yes, verbose):
+def main(configuration_path, data_path, model_path, chunksize, n_jobs, yes, verbose):
     '''
     Apply loaded model to data.
 
@@ -58,6 +59,9 @@ def main(configuration_path, data_path, model_path, chunksize, yes, verbose):
     model = load_model(model_path)
     log.debug('Loaded model')
 
+    if n_jobs:
+        set_n_jobs(model, n_jobs)
+
     df_generator = read_telescope_data_chunked(
         data_path, config, chunksize, model_config.columns_to_read_apply,
         feature_generation_config=model_config.feature_generation
@@ -18,7 +18,7 @@ from fact.coordinates import (
 )
 from fact.instrument import camera_distance_mm_to_deg
 
-from ..apply import predict_energy, predict_disp, predict_separator
+from ..apply import predict_energy, predict_disp, predict_separator, set_n_jobs
 from ..parallel import parallelize_array_computation
 from ..io import (
     read_telescope_data_chunked,
@@ -269,10 +269,8 @@ def main(
     log.info('Done')
 
     if n_jobs:
-        separator_model.n_jobs = n_jobs
-        energy_model.n_jobs = n_jobs
-        disp_model.n_jobs = n_jobs
-        sign_model.n_jobs = n_jobs
+        for model in (separator_model, energy_model, disp_model, sign_model):
+            set_n_jobs(model, n_jobs)
 
     columns = set(needed_columns)
     for model in ('separator', 'energy', 'disp'):
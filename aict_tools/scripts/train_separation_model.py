@@ -1,26 +1,38 @@
 import pandas as pd
 import click
 from sklearn import model_selection
+from sklearn.base import clone
 from sklearn.calibration import CalibratedClassifierCV
-from tqdm import tqdm
+from joblib import Parallel, delayed
 import numpy as np
 from sklearn import metrics
 from fact.io import check_extension, write_data
 
 from ..configuration import AICTConfig
 from ..io import save_model, read_telescope_data
-from ..preprocessing import convert_to_float32
+from ..preprocessing import convert_to_float32, check_valid_rows
 from ..logging import setup_logging
 
 
+def fit_and_predict_fold(classifier, X, y, train, test):
+    ''' Fit a copy of classifier on the train split and predict the test split '''
+    classifier = clone(classifier)
+    classifier.fit(X[train], y[train])
+    return classifier.predict_proba(X[test])[:, 1]
+
+
 @click.command()
 @click.argument('configuration_path', type=click.Path(exists=True, dir_okay=False))
 @click.argument('signal_path', type=click.Path(exists=True, dir_okay=False))
 @click.argument('background_path', type=click.Path(exists=True, dir_okay=False))
 @click.argument('predictions_path', type=click.Path(exists=False, dir_okay=False))
 @click.argument('model_path', type=click.Path(exists=False, dir_okay=False))
+@click.option(
+    '-j', '--n-jobs-cv', type=int, default=1,
+    help='Number of cross validation folds to train in parallel',
+)
 @click.option('-v', '--verbose', help='Verbose log output', is_flag=True)
-def main(configuration_path, signal_path, background_path, predictions_path, model_path, verbose):
+def main(configuration_path, signal_path, background_path, predictions_path, model_path, n_jobs_cv, verbose):
     '''
     Train a classifier on signal and background monte carlo data and write the model
     to MODEL_PATH in pmml or pickle format.
@@ -68,31 +80,25 @@ def main(configuration_path, signal_path, background_path, predictions_path, mod
     df_train = convert_to_float32(df[model_config.features])
     log.debug('Total training events: {}'.format(len(df_train)))
 
-    df_train.dropna(how='any', inplace=True)
-    log.debug('Training events after dropping nans: {}'.format(len(df_train)))
-
-    label = df.loc[df_train.index, 'label']
+    valid = check_valid_rows(df_train).to_numpy()
+    X = df_train.to_numpy()[valid]
+    y = df['label'].to_numpy()[valid]
+    log.debug('Training events after dropping nans: {}'.format(len(X)))
 
     # load optional columns if available to be able to make performance plots
     # vs true energy / size
     if config.true_energy_column is not None:
-        true_energy = df.loc[df_train.index, config.true_energy_column].to_numpy()
+        true_energy = df[config.true_energy_column].to_numpy()[valid]
     if config.size_column is not None:
-        size = df.loc[df_train.index, config.size_column].to_numpy()
+        size = df[config.size_column].to_numpy()[valid]
 
-    n_gammas = len(label[label == 1])
-    n_protons = len(label[label == 0])
+    n_gammas = np.count_nonzero(y == 1)
+    n_protons = np.count_nonzero(y == 0)
     log.info('Training classifier with {} background and {} signal events'.format(
         n_protons, n_gammas
     ))
     log.debug(model_config.features)
 
-    # save prediction_path for each cv iteration
-    cv_predictions = []
-
-    # iterate over test and training sets
-    X = df_train.values
-    y = label.values
     n_cross_validations = model_config.n_cross_validations
     classifier = model_config.model
 
@@ -102,35 +108,57 @@ def main(configuration_path, signal_path, background_path, predictions_path, mod
         n_splits=n_cross_validations, shuffle=True, random_state=config.seed
     )
 
+    # folds are independent, so they can be trained in parallel.
+    # Worker processes do not share the numpy random state seeded by the config,
+    # so each classifier gets a fixed random state to make the result independent
+    # of n_jobs_cv. In parallel, each classifier only uses one core
+    # to not oversubscribe the cpus
+    fold_classifier = clone(classifier)
+    params = fold_classifier.get_params()
+    if 'random_state' in params and params['random_state'] is None:
+        fold_classifier.set_params(random_state=config.seed)
+    if n_jobs_cv != 1 and 'n_jobs' in params:
+        fold_classifier.set_params(n_jobs=1)
+
+    splits = list(stratified_kfold.split(X, y))
+    fold_probas = Parallel(n_jobs=n_jobs_cv)(
+        delayed(fit_and_predict_fold)(fold_classifier, X, y, train, test)
+        for train, test in splits
+    )
+
+    # collect the predictions of all folds, each event is in exactly one test set
+    n_events = len(y)
+    cv_predictions = {
+        'label': np.empty(n_events, dtype=y.dtype),
+        model_config.output_name: np.empty(n_events),
+        'cv_fold': np.empty(n_events, dtype=int),
+    }
+    if config.true_energy_column is not None:
+        cv_predictions[config.true_energy_column] = np.empty(n_events, dtype=true_energy.dtype)
+    if config.size_column is not None:
+        cv_predictions[config.size_column] = np.empty(n_events, dtype=size.dtype)
+
     aucs = []
-    cv_it = stratified_kfold.split(X, y)
-    for fold, (train, test) in enumerate(tqdm(cv_it, total=n_cross_validations)):
-        # select data
-        xtrain, xtest = X[train], X[test]
-        ytrain, ytest = y[train], y[test]
-
-        # fit and predict
-        classifier.fit(xtrain, ytrain)
-
-        y_probas = classifier.predict_proba(xtest)[:, 1]
-
-        cv_df = pd.DataFrame({
-            'label': ytest,
-            model_config.output_name: y_probas,
-            'cv_fold': fold,
-        })
+    offset = 0
+    for fold, ((_, test), y_probas) in enumerate(zip(splits, fold_probas)):
+        ytest = y[test]
+        fold_slice = slice(offset, offset + len(test))
+        offset += len(test)
+
+        cv_predictions['label'][fold_slice] = ytest
+        cv_predictions[model_config.output_name][fold_slice] = y_probas
+        cv_predictions['cv_fold'][fold_slice] = fold
         if config.true_energy_column is not None:
-            cv_df[config.true_energy_column] = true_energy[test]
+            cv_predictions[config.true_energy_column][fold_slice] = true_energy[test]
         if config.size_column is not None:
-            cv_df[config.size_column] = size[test]
-        cv_predictions.append(cv_df)
+            cv_predictions[config.size_column][fold_slice] = size[test]
         aucs.append(metrics.roc_auc_score(ytest, y_probas))
 
     aucs = np.array(aucs)
     log.info('Cross-validation ROC-AUCs: {}'.format(aucs))
     log.info('Mean AUC ROC : {:.3f} ± {:.3f}'.format(aucs.mean(), aucs.std()))
 
-    predictions_df = pd.concat(cv_predictions, ignore_index=True)
+    predictions_df = pd.DataFrame(cv_predictions)
     log.info('Writing predictions from cross validation')
     write_data(predictions_df, predictions_path, mode='w')
 
@@ -0,0 +1,20 @@
+import numpy as np
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier
+
+
+def test_set_n_jobs_calibrated():
+    from aict_tools.apply import set_n_jobs
+
+    X = np.random.normal(size=(100, 2))
+    y = (X[:, 0] > 0).astype(int)
+    model = CalibratedClassifierCV(RandomForestClassifier(n_estimators=2, n_jobs=1), cv=2)
+    model.fit(X, y)
+
+    set_n_jobs(model, 4)
+    assert model.n_jobs == 4
+    for calibrated in model.calibrated_classifiers_:
+        estimator = getattr(calibrated, 'estimator', None)
+        if estimator is None:
+            estimator = calibrated.base_estimator
+        assert estimator.n_jobs == 4
@@ -63,3 +63,38 @@ def test_altitude():
 
     alt_config = AICTConfig.from_yaml('examples/config_source_altitude.yaml')
     assert 'source_position_alt' in alt_config.disp.columns_to_read_train
+
+
+def test_parse_model():
+    from aict_tools.configuration import parse_model
+    from sklearn.ensemble import RandomForestClassifier, AdaBoostClassifier
+    from sklearn.tree import DecisionTreeClassifier
+
+    model = parse_model('''
+    ensemble.RandomForestClassifier(
+        n_estimators=10,
+        max_features='sqrt',
+    )
+    ''')
+    assert isinstance(model, RandomForestClassifier)
+    assert model.n_estimators == 10
+    assert model.max_features == 'sqrt'
+
+    model = parse_model(
+        'ensemble.AdaBoostClassifier(tree.DecisionTreeClassifier(max_depth=3), n_estimators=10)'
+    )
+    assert isinstance(model, AdaBoostClassifier)
+    # the base estimator parameter was renamed in scikit-learn 1.2
+    base_estimator = getattr(model, 'estimator', None) or model.base_estimator
+    assert isinstance(base_estimator, DecisionTreeClassifier)
+    assert base_estimator.max_depth == 3
+    assert model.n_estimators == 10
+
+    with raises(ValueError):
+        parse_model('ensemble.RandomForestClassifier(n_estimators=__import__("os"))')
+
+    with raises(ValueError):
+        parse_model('ensemble.AdaBoostClassifier(os.system("ls"))')
+
+    with raises(ValueError):
+        parse_model('os.system("ls")')
@@ -33,3 +33,66 @@ def test_multiple_config():
             h5py.File(f.name, 'r'), n_events=len(df), selection_config=config
         )
         assert all(mask == [False, True, False, True])
+
+
+def test_create_mask_in_memory():
+    from aict_tools.apply import create_mask
+
+    config = [{'a': ['>', 1]}, {'b': ['<', 5]}]
+    col_data = {'a': df['a'].to_numpy(), 'b': df['b'].to_numpy()}
+
+    mask = create_mask(col_data, config)
+    assert all(mask == [False, True, False, True])
+
+
+def test_pack_event_ids():
+    import numpy as np
+    import pytest
+    from aict_tools.apply import pack_event_ids
+
+    keys = pack_event_ids([1, 1, 2], [5, 6, 5])
+    assert keys.dtype == np.uint64
+    assert len(np.unique(keys)) == 3
+    assert keys[0] == (1 << 32) + 5
+
+    with pytest.raises(ValueError):
+        pack_event_ids([1], [2**32])
+
+
+def test_compile_selection():
+    from aict_tools.apply import compile_selection
+
+    select = compile_selection({'a': ['>', 2], 'b': ['<', 5]})
+
+    for chunk in (df.iloc[:2], df.iloc[2:]):
+        col_data = {'a': chunk['a'].to_numpy(), 'b': chunk['b'].to_numpy()}
+        assert len(select(col_data)) == len(chunk)
+
+    col_data = {'a': df['a'].to_numpy(), 'b': df['b'].to_numpy()}
+    assert all(select(col_data) == [False, False, False, True])
+
+
+def test_apply_event_selection_duplicate_keys():
+    import numpy as np
+    from aict_tools.apply import apply_event_selection_h5py_chunked, pack_event_ids
+
+    # the same keys occur several times in the input
+    events = pd.DataFrame({
+        'run_id': [1, 1, 2, 2, 1, 1, 2],
+        'array_event_id': [1, 2, 1, 2, 1, 2, 3],
+        'value': [0, 1, 2, 3, 4, 5, 6],
+    })
+    # enough selected events for np.isin to use its sorting algorithm
+    selected = pack_event_ids([1, 2] + [3] * 20, [1, 3] + list(range(20)))
+
+    with tempfile.NamedTemporaryFile(prefix='test_aict_', suffix='.hdf5') as infile, \
+            tempfile.NamedTemporaryFile(prefix='test_aict_', suffix='.hdf5') as outfile:
+        to_h5py(events, infile.name, key='array_events')
+        h5py.File(outfile.name, 'w').close()
+
+        apply_event_selection_h5py_chunked(
+            infile.name, outfile.name, selected, progress=False
+        )
+
+        with h5py.File(outfile.name, 'r') as f:
+            assert np.all(f['array_events']['value'][:] == [0, 4, 6])
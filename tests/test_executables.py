@@ -52,6 +52,82 @@ def test_apply_cuts():
                 assert 'runs' in f
 
 
+def test_apply_cuts_large_chunksize():
+    from aict_tools.scripts.apply_cuts import main
+
+    with tempfile.TemporaryDirectory(prefix='aict_tools_test_') as d:
+        output_file = os.path.join(d, 'gamma_cuts.hdf5')
+        input_file = 'examples/gamma.hdf5'
+
+        result = CliRunner().invoke(
+            main,
+            ['examples/quality_cuts.yaml', input_file, output_file, '-N', '1000000'],
+        )
+
+        if result.exit_code != 0:
+            print(result.output)
+            print_exception(*result.exc_info)
+        assert result.exit_code == 0
+
+        # hdf5 chunks must not follow the processing chunksize,
+        # as chunks are allocated at full size on disk
+        assert os.path.getsize(output_file) <= os.path.getsize(input_file)
+        with h5py.File(output_file, 'r') as f:
+            for dataset in f['events'].values():
+                assert dataset.chunks[0] < 1000000
+
+
+@pytest.mark.parametrize('chunksize', [None, 7, 100])
+def test_apply_cuts_multiple_telescopes(chunksize):
+    from aict_tools.scripts.apply_cuts import main
+    import numpy as np
+
+    with tempfile.TemporaryDirectory(prefix='aict_tools_test_') as d:
+        config_file = os.path.join(d, 'cuts.yaml')
+        with open(config_file, 'w') as f:
+            f.write('multiple_telescopes: True\nselection:\n  - intensity: [">=", 300]\n')
+
+        output_file = os.path.join(d, 'gamma_cta_cuts.hdf5')
+        input_file = 'examples/gamma_cta.hdf5'
+        args = [config_file, input_file, output_file]
+        if chunksize is not None:
+            args += ['-N', str(chunksize)]
+
+        with DateNotModified(input_file):
+            result = CliRunner().invoke(main, args)
+
+            if result.exit_code != 0:
+                print(result.output)
+                print_exception(*result.exc_info)
+            assert result.exit_code == 0
+
+        # the output only contains a subset of the input, see test_apply_cuts_large_chunksize
+        assert os.path.getsize(output_file) <= os.path.getsize(input_file)
+
+        with h5py.File(input_file, 'r') as f_in, h5py.File(output_file, 'r') as f_out:
+            tel_in = f_in['telescope_events']
+            tel_out = f_out['telescope_events']
+            mask = tel_in['intensity'][:] >= 300
+            assert 0 < np.count_nonzero(mask) < len(mask)
+            for name in tel_in:
+                assert np.array_equal(tel_out[name][:], tel_in[name][:][mask], equal_nan=True)
+
+            # array events of the remaining telescope events, in file order
+            tel_ids = np.column_stack([tel_out['run_id'][:], tel_out['array_event_id'][:]])
+            _, first = np.unique(tel_ids, axis=0, return_index=True)
+            expected_ids = tel_ids[np.sort(first)]
+
+            array_out = f_out['array_events']
+            array_ids = np.column_stack([array_out['run_id'][:], array_out['array_event_id'][:]])
+            assert np.array_equal(array_ids, expected_ids)
+
+            array_in = f_in['array_events']
+            in_ids = np.column_stack([array_in['run_id'][:], array_in['array_event_id'][:]])
+            array_mask = (in_ids[:, None] == expected_ids[None]).all(axis=2).any(axis=1)
+            for name in array_in:
+                assert np.array_equal(array_out[name][:], array_in[name][:][array_mask], equal_nan=True)
+
+
 def test_train_regressor_cta():
     from aict_tools.scripts.train_energy_regressor import main
 
@@ -193,6 +269,7 @@ def test_apply_separator(temp_dir, separator_model):
             os.path.join(temp_dir, 'gamma.hdf5'),
             separator_model,
             '--yes',
+            '--n-jobs', '2',
         ]
     )
 
@@ -205,6 +282,37 @@ def test_apply_separator(temp_dir, separator_model):
         assert 'gammaness' in f['events']
 
 
+def test_train_separator_parallel_cv_reproducible(temp_dir):
+    from aict_tools.scripts.train_separation_model import main
+    from fact.io import read_data
+
+    runner = CliRunner()
+    predictions = []
+    # the result must neither change between runs nor depend on -j
+    for i, n_jobs in enumerate(['2', '2', '1']):
+        predictions_path = os.path.join(temp_dir, 'cv_separator_{}.hdf5'.format(i))
+        result = runner.invoke(
+            main,
+            [
+                'examples/config_separator.yaml',
+                'examples/gamma.hdf5',
+                'examples/proton.hdf5',
+                predictions_path,
+                os.path.join(temp_dir, 'separator_{}.pkl'.format(i)),
+                '-j', n_jobs,
+            ]
+        )
+
+        if result.exit_code != 0:
+            print(result.output)
+            print_exception(*result.exc_info)
+        assert result.exit_code == 0
+        predictions.append(read_data(predictions_path, key='data'))
+
+    assert predictions[0].equals(predictions[1])
+    assert predictions[0].equals(predictions[2])
+
+
 def test_train_disp_altitude():
     from aict_tools.scripts.train_disp_regressor import main as train
 